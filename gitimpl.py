@@ -4,15 +4,25 @@ import zlib
 import hashlib
 import struct
 from pathlib import Path
-from typing import Tuple, List, cast
+from typing import Dict, Iterable, Tuple, List, cast
 import urllib.request
 import zipfile
 import tempfile
 import os
 import shutil
+import subprocess
 import re
 import json
 import time
+import functools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# A ref advertisement line: pkt-line length, SHA and ref name (the first one follows a flush-pkt)
+REF_LINE_RE = re.compile(rb"(?m)^(?:0000)?[0-9a-f]{4}([0-9a-f]{40}) ([^\0\n]+)")
+
+# Owner and repository name in a GitHub HTTPS or SSH URL
+GITHUB_URL_RE = re.compile(r'github\.com[:/]([^/]+)/([^/\.]+)')
 
 def init_repo(parent: Path):
     (parent / ".git").mkdir(parents=True)
@@ -20,49 +30,197 @@ def init_repo(parent: Path):
     (parent / ".git" / "refs" / "heads").mkdir(parents=True)
     (parent / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
 
+# Trees get looked up again while walking and objects never change once written, so recently
+# read trees are kept. Blobs are read once during checkout and could be large, so they aren't.
+TREE_CACHE: "OrderedDict[Tuple[Path, str], bytes]" = OrderedDict()
+TREE_CACHE_SIZE = 4096
+
 def read_object(parent: Path, sha: str) -> Tuple[str, bytes]:
+    key = (parent, sha)
+    if key in TREE_CACHE:
+        TREE_CACHE.move_to_end(key)
+        return "tree", TREE_CACHE[key]
     pre = sha[:2]
     post = sha[2:]
     p = parent / ".git" / "objects" / pre / post
-    bs = p.read_bytes()
+    fd = os.open(p, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        bs = os.read(fd, size)
+        # A single read returns at most about 2 GiB on Linux
+        while len(bs) < size and (chunk := os.read(fd, size - len(bs))):
+            bs += chunk
+    finally:
+        os.close(fd)
     head, content = zlib.decompress(bs).split(b"\0", maxsplit=1)
     ty, _ = head.split(b" ")
+    if ty == b"tree":
+        TREE_CACHE[key] = content
+        if len(TREE_CACHE) > TREE_CACHE_SIZE:
+            TREE_CACHE.popitem(last=False)
     return ty.decode(), content
 
+# Object fan-out directories known to exist, so each is only created once
+OBJECT_DIRS = set()
+
+def parse_compression_level(value: str) -> int:
+    """Parse a zlib compression level, rejecting anything outside -1..9."""
+    try:
+        level = int(value)
+    except ValueError:
+        level = None
+    if level is None or not -1 <= level <= 9:
+        raise ValueError(f"invalid compression level {value!r}: expected an integer from -1 to 9")
+    return level
+
+def use_compression_level(value: str, source: str = "-c"):
+    """Validate a level from -c or GITIMPL_COMPRESSION up front and apply it to all later writes."""
+    try:
+        level = parse_compression_level(value)
+    except ValueError as e:
+        sys.exit(f"error: {source}: {e}")
+    # Set through the environment so write_tree's worker processes see it too
+    os.environ["GITIMPL_COMPRESSION"] = str(level)
+
+def compression_level(size: int) -> int:
+    """Pick the zlib level for an object of the given size, honouring GITIMPL_COMPRESSION if set."""
+    level = os.environ.get("GITIMPL_COMPRESSION")
+    if level is not None:
+        return parse_compression_level(level)
+    # Large objects are mostly binaries that barely compress, so just store them
+    return 0 if size > 1 << 20 else zlib.Z_BEST_SPEED
+
+def compress_to(p: Path, header: bytes, chunks: Iterable[bytes], level: int = zlib.Z_BEST_SPEED):
+    """Deflate an object's header and content chunks into the loose object file at p."""
+    if p.exists():
+        # Objects are content-addressed, so an existing file already holds this content
+        return
+    if p.parent not in OBJECT_DIRS:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        OBJECT_DIRS.add(p.parent)
+    # Write to a temp file in the same directory and rename it into place
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=p.parent, prefix="tmp_obj_")
+    except FileNotFoundError:
+        # The repository was removed and recreated since the directory was cached
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=p.parent, prefix="tmp_obj_")
+    try:
+        co = zlib.compressobj(level)
+        with os.fdopen(fd, "wb") as f:
+            f.write(co.compress(header))
+            for chunk in chunks:
+                f.write(co.compress(chunk))
+            f.write(co.flush())
+        # mkstemp creates the file as 0600; loose objects are read-only but world-readable, as in git.
+        # os.chmod on the path (unlike os.fchmod) is also available on Windows.
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, p)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 def write_object(parent: Path, ty: str, content: bytes) -> str:
-    header = ty.encode() + b" " + f"{len(content)}".encode() + b"\0"
-    store = header + content
-    hash = hashlib.sha1(store, usedforsecurity=False).hexdigest()
-    compressed = zlib.compress(store, level=zlib.Z_BEST_SPEED)
+    header = f"{ty} {len(content)}\0".encode()
+    # Hash and deflate header and content separately so the full object is never copied
+    h = hashlib.sha1(usedforsecurity=False)
+    h.update(header)
+    h.update(content)
+    hash = h.hexdigest()
     pre = hash[:2]
     post = hash[2:]
-    p = parent / ".git" / "objects" / pre / post
-    p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_bytes(compressed)
+    compress_to(parent / ".git" / "objects" / pre / post, header, [content], compression_level(len(content)))
     return hash
 
-def get_github_default_branch(repo_url):
-    """Determine the default branch of a GitHub repository."""
+def decode_varint(bs: bytes, pos: int = 0) -> Tuple[int, int]:
+    """Decode a little-endian base-128 varint, returning (value, length)."""
+    # Load up to 8 bytes as one word and find the first byte without the continuation bit
+    w = int.from_bytes(bs[pos:pos + 8], "little")
+    stop = ~w & 0x8080808080808080
+    if not stop:
+        # Longer than 8 bytes, fall back to decoding byte by byte
+        value, off, i = 0, 0, pos
+        while True:
+            value |= (bs[i] & 0b01111111) << off
+            off += 7
+            i += 1
+            if not bs[i - 1] & 0b10000000:
+                return value, i - pos
+    n = (stop & -stop).bit_length() // 8
+    # Keep the varint's bytes, drop the continuation bits and pack the 7-bit groups together
+    x = w & ((1 << (8 * n)) - 1) & 0x7F7F7F7F7F7F7F7F
+    x = (x & 0x007F007F007F007F) | ((x & 0x7F007F007F007F00) >> 1)
+    x = (x & 0x00003FFF00003FFF) | ((x & 0x3FFF00003FFF0000) >> 2)
+    x = (x & 0x000000000FFFFFFF) | ((x & 0x0FFFFFFF00000000) >> 4)
+    return x, n
+
+# Default branches rarely change, so lookups are kept across runs. The path is resolved lazily
+# because Path.home() fails when no home directory can be determined.
+def default_branch_cache() -> Path:
+    return Path.home() / ".cache" / "gitimpl" / "default_branch.json"
+
+def github_repo_key(repo_url):
+    """Return "owner/repo" for a GitHub URL, or None if it isn't one."""
     # Extract owner and repo name from URL
-    match = re.search(r'github\.com[:/]([^/]+)/([^/\.]+)', repo_url)
+    match = GITHUB_URL_RE.search(repo_url)
     if not match:
         return None
     
     owner, repo = match.groups()
     if repo.endswith('.git'):
         repo = repo[:-4]
+    return f"{owner}/{repo}"
+
+def load_default_branches() -> dict:
+    try:
+        return json.loads(default_branch_cache().read_text())
+    except (OSError, RuntimeError, ValueError):
+        # Missing or unreadable cache, or no home directory
+        return {}
+
+def save_default_branches(cached: dict):
+    try:
+        cache = default_branch_cache()
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        cache.write_text(json.dumps(cached))
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: Could not cache default branch: {e}")
+
+@functools.lru_cache(maxsize=None)
+def get_github_default_branch(repo_url):
+    """Determine the default branch of a GitHub repository."""
+    key = github_repo_key(repo_url)
+    if not key:
+        return None
+    
+    cached = load_default_branches()
+    if key in cached:
+        return cached[key]
     
-    api_url = f"https://api.github.com/repos/{owner}/{repo}"
+    api_url = f"https://api.github.com/repos/{key}"
     
     try:
         req = urllib.request.Request(api_url)
         with urllib.request.urlopen(req) as response:
             data = json.loads(response.read().decode('utf-8'))
-            return data.get('default_branch')
+            branch = data.get('default_branch')
     except Exception as e:
         print(f"Error retrieving default branch: {e}")
         # Try common branch names
         return None
+    
+    if branch:
+        cached[key] = branch
+        save_default_branches(cached)
+    return branch
+
+def forget_default_branch(repo_url):
+    """Drop a stale default branch, e.g. after the repository renamed it."""
+    get_github_default_branch.cache_clear()
+    key = github_repo_key(repo_url)
+    cached = load_default_branches()
+    if cached.pop(key, None) is not None:
+        save_default_branches(cached)
 
 def clone_via_zip(url: str, target_dir: Path):
     """Clone a repository by downloading its ZIP file and initializing a git repo."""
@@ -86,95 +244,92 @@ def clone_via_zip(url: str, target_dir: Path):
             print(f"Attempting to download {zip_url}")
             
             try:
-                # Create a temporary directory
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    zip_path = os.path.join(temp_dir, "repo.zip")
-                    
+                # Buffer the download in memory, spilling to disk only for large archives. Before
+                # Python 3.11 SpooledTemporaryFile lacks seekable(), which zipfile needs, so use a
+                # plain temporary file there.
+                if sys.version_info >= (3, 11):
+                    zip_file = tempfile.SpooledTemporaryFile(max_size=64 << 20)
+                else:
+                    zip_file = tempfile.TemporaryFile()
+                with zip_file as zip_buf:
                     # Download the ZIP file
                     print("Downloading zip archive...")
-                    urllib.request.urlretrieve(zip_url, zip_path)
+                    with urllib.request.urlopen(zip_url) as response:
+                        shutil.copyfileobj(response, zip_buf)
                     
-                    # Extract the ZIP file
+                    # Extract the ZIP file straight into the target directory
                     print("Extracting files...")
-                    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                        zip_ref.extractall(temp_dir)
-                    
-                    # Find the extracted directory (usually repository-branch)
-                    extracted_dirs = [d for d in os.listdir(temp_dir) 
-                                     if os.path.isdir(os.path.join(temp_dir, d)) and d != "__MACOSX"]
-                    if not extracted_dirs:
-                        print("Error: Could not find extracted repository directory")
-                        continue  # Try next branch option
-                    
-                    extracted_dir = os.path.join(temp_dir, extracted_dirs[0])
-                    
-                    # Create target directory if it doesn't exist
-                    target_dir.mkdir(parents=True, exist_ok=True)
-                    
-                    # Copy all files from extracted directory to target directory
-                    for item in os.listdir(extracted_dir):
-                        src_path = os.path.join(extracted_dir, item)
-                        dst_path = os.path.join(target_dir, item)
+                    with zipfile.ZipFile(zip_buf, 'r') as zip_ref:
+                        members = [info for info in zip_ref.infolist()
+                                   if not info.filename.startswith("__MACOSX/")]
                         
-                        if os.path.isdir(src_path):
-                            if os.path.exists(dst_path):
-                                shutil.rmtree(dst_path)
-                            shutil.copytree(src_path, dst_path)
-                        else:
-                            shutil.copy2(src_path, dst_path)
-                    
-                    # Initialize git repository
-                    init_repo(target_dir)
-                    
-                    # Set HEAD to point to the correct branch
-                    (target_dir / ".git" / "HEAD").write_text(f"ref: refs/heads/{branch}\n")
-                    
-                    # Create initial commit for the files
-                    def create_initial_commit(target_dir, branch_name):
-                        # Save current directory
-                        original_dir = os.getcwd()
-                        try:
-                            # Change to target directory
-                            os.chdir(target_dir)
-                            
-                            # Get tree hash
-                            tree_hash = write_tree(target_dir)
-                            
-                            # Create commit
-                            if tree_hash:
-                                timestamp = int(time.time())
-                                contents = b"".join([
-                                    b"tree %b\n" % tree_hash.encode(),
-                                    f"author System <system@example.com> {timestamp} -0000\n".encode(),
-                                    f"committer System <system@example.com> {timestamp} -0000\n\n".encode(),
-                                    f"Initial commit from zip archive ({branch_name} branch)\n".encode(),
-                                    b"\n"
-                                ])
-                                commit_hash = write_object(target_dir, "commit", contents)
-                                
-                                # Update branch ref
-                                refs_path = target_dir / ".git" / "refs" / "heads" / branch_name
-                                refs_path.parent.mkdir(parents=True, exist_ok=True)
-                                refs_path.write_text(commit_hash + "\n")
-                                
-                                return commit_hash
-                            return None
-                        finally:
-                            # Restore original directory
-                            os.chdir(original_dir)
+                        # Find the top-level directory (usually repository-branch)
+                        roots = [info.filename.split("/", 1)[0] for info in members if "/" in info.filename]
+                        if not roots:
+                            print("Error: Could not find repository directory in archive")
+                            continue  # Try next branch option
+                        
+                        prefix = roots[0] + "/"
+                        
+                        # Create target directory if it doesn't exist
+                        target_dir.mkdir(parents=True, exist_ok=True)
+                        
+                        # Strip the top-level directory from each member as it is extracted
+                        for info in members:
+                            if not info.filename.startswith(prefix) or info.filename == prefix:
+                                continue
+                            info.filename = info.filename[len(prefix):]
+                            zip_ref.extract(info, target_dir)
                     
-                    commit_hash = create_initial_commit(target_dir, branch)
-                    if commit_hash:
-                        print(f"Created initial commit: {commit_hash}")
-                        print(f"Repository cloned successfully to {target_dir} (branch: {branch})")
-                        return True
-                    else:
-                        print("Failed to create initial commit")
-                        continue  # Try next branch
+                # Initialize git repository
+                init_repo(target_dir)
+                
+                # Set HEAD to point to the correct branch
+                (target_dir / ".git" / "HEAD").write_text(f"ref: refs/heads/{branch}\n")
+                
+                # Create initial commit for the files
+                def create_initial_commit(target_dir, branch_name):
+                    # Get tree hash
+                    tree_hash = write_tree(target_dir)
                     
+                    # Create commit
+                    if tree_hash:
+                        timestamp = int(time.time())
+                        contents = b"".join([
+                            b"tree %b\n" % tree_hash.encode(),
+                            f"author System <system@example.com> {timestamp} -0000\n".encode(),
+                            f"committer System <system@example.com> {timestamp} -0000\n\n".encode(),
+                            f"Initial commit from zip archive ({branch_name} branch)\n".encode(),
+                            b"\n"
+                        ])
+                        commit_hash = write_object(target_dir, "commit", contents)
+                        
+                        # Update branch ref
+                        refs_path = target_dir / ".git" / "refs" / "heads" / branch_name
+                        refs_path.parent.mkdir(parents=True, exist_ok=True)
+                        refs_path.write_text(commit_hash + "\n")
+                        
+                        return commit_hash
+                    return None
+                
+                commit_hash = create_initial_commit(target_dir, branch)
+                if commit_hash:
+                    print(f"Created initial commit: {commit_hash}")
+                    print(f"Repository cloned successfully to {target_dir} (branch: {branch})")
+                    return True
+                else:
+                    print("Failed to create initial commit")
+                    continue  # Try next branch
+                
             except urllib.error.HTTPError as e:
                 if e.code == 404:
                     print(f"Branch '{branch}' not found, trying next option...")
+                    if branch == default_branch:
+                        # The default branch may have been renamed since it was looked up (and cached)
+                        forget_default_branch(url)
+                        fresh_branch = get_github_default_branch(url)
+                        fallbacks = [fresh_branch] if fresh_branch and fresh_branch != branch else ['main', 'master', 'trunk', 'develop']
+                        branch_options.extend(b for b in fallbacks if b not in branch_options)
                     continue  # Try next branch option
                 else:
                     print(f"HTTP error during ZIP download: {e}")
@@ -190,35 +345,114 @@ def clone_via_zip(url: str, target_dir: Path):
         print(f"ZIP-based cloning only supports GitHub repositories")
         return False
 
+# Below this many files, forking worker processes costs more than it saves
+PARALLEL_TREE_MIN_FILES = 256
+
+class FileChangedError(Exception):
+    """Raised when a file changes while it is being stored as a blob."""
+
+def read_chunks(f, size: int, before: os.stat_result) -> Iterable[bytes]:
+    """Yield exactly size bytes of f, failing if the file changed since before was taken."""
+    remaining = size
+    while remaining:
+        chunk = f.read(min(remaining, 1 << 16))
+        if not chunk:
+            raise FileChangedError("file shrank while being read")
+        remaining -= len(chunk)
+        yield chunk
+    if not unchanged(f, before):
+        raise FileChangedError("file was modified while being read")
+
+def unchanged(f, before: os.stat_result) -> bool:
+    after = os.fstat(f.fileno())
+    return (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+
+# How often to re-read a file that keeps changing underneath us before giving up
+BLOB_WRITE_ATTEMPTS = 3
+
+def write_blob_file(parent: Path, path: Path) -> str:
+    """Store a file's contents as a blob object, streaming it rather than reading it whole."""
+    try:
+        for attempt in range(BLOB_WRITE_ATTEMPTS):
+            try:
+                with open(path, "rb", buffering=0) as f:
+                    before = os.fstat(f.fileno())
+                    size = before.st_size
+                    header = f"blob {size}\0".encode()
+                    h = hashlib.sha1(header, usedforsecurity=False)
+                    if hasattr(hashlib, "file_digest"):
+                        hashlib.file_digest(f, lambda: h)
+                        # file_digest reads to EOF, so any growth shows up as extra bytes
+                        if f.tell() != size or not unchanged(f, before):
+                            raise FileChangedError("file was modified while being hashed")
+                    else:  # Python < 3.11
+                        for chunk in read_chunks(f, size, before):
+                            h.update(chunk)
+                    hash = h.hexdigest()
+                    f.seek(0)
+                    pre = hash[:2]
+                    post = hash[2:]
+                    # The check at the end of read_chunks fails the write before the object is renamed into place
+                    chunks = read_chunks(f, size, before)
+                    compress_to(parent / ".git" / "objects" / pre / post, header, chunks, compression_level(size))
+                return hash
+            except FileChangedError:
+                if attempt == BLOB_WRITE_ATTEMPTS - 1:
+                    raise
+    except Exception as e:
+        print(f"Warning: Could not read {path}: {e}")
+        return "0" * 40
+
 def write_tree(parent: Path = None) -> str:
-    """Create a tree object from the current directory"""
+    """Create a tree object from the given directory (the current directory by default)"""
     if parent is None:
         parent = Path(".")
-        
-    def toEntry(p: Path, exclude_git: bool = False) -> Tuple[str, str, str]:
-        mode = "40000" if p.is_dir() else "100644"
-        if p.is_dir():
-            entries = [
-                toEntry(child)
-                for child in sorted(p.iterdir())
-                if not (exclude_git and child.name == ".git")
-                and not child.name.startswith(".") # Skip hidden files/dirs
-            ]
-            b_entries = b"".join(
-                m.encode() + b" " + n.encode() + b"\0" + bytes.fromhex(h)
-                for m, n, h in entries
-            )
-            hash = write_object(parent, "tree", b_entries)
-            return mode, p.name, hash
-        else:
-            try:
-                hash = write_object(parent, "blob", p.read_bytes())
-                return mode, p.name, hash
-            except Exception as e:
-                print(f"Warning: Could not read {p}: {e}")
-                return mode, p.name, "0" * 40
 
-    _, _, tree_hash = toEntry(Path(".").absolute(), True)
+    files: List[Path] = []
+
+    def collect(p: Path, exclude_git: bool = False) -> list:
+        children = []
+        # DirEntry caches the file type from the directory listing, saving a stat per child
+        with os.scandir(p) as it:
+            dir_entries = sorted(it, key=lambda e: e.name)
+        for e in dir_entries:
+            if (exclude_git and e.name == ".git") or e.name[0] == ".": # Skip hidden files/dirs
+                continue
+            child = Path(e.path)
+            if e.is_dir():
+                children.append((child, collect(child)))
+            else:
+                children.append((child, None))
+                files.append(child)
+        return children
+
+    # Walk the tree first so the blobs can be hashed and compressed across processes
+    root = parent.resolve()
+    tree = collect(root, True)
+    if len(files) < PARALLEL_TREE_MIN_FILES:
+        hashes = [write_blob_file(parent, f) for f in files]
+    else:
+        with ProcessPoolExecutor() as executor:
+            chunksize = max(1, len(files) // ((os.cpu_count() or 1) * 4))
+            hashes = list(executor.map(write_blob_file, [parent] * len(files), files, chunksize=chunksize))
+    blob_hashes = dict(zip(files, hashes))
+
+    def toEntry(p: Path, children: list) -> Tuple[str, str, str]:
+        if children is None:
+            return "100644", p.name, blob_hashes[p]
+        # Append each entry to one growing buffer instead of concatenating small bytes objects
+        b_entries = bytearray()
+        for child, grandchildren in children:
+            m, n, h = toEntry(child, grandchildren)
+            b_entries += m.encode()
+            b_entries.append(0x20)
+            b_entries += n.encode()
+            b_entries.append(0)
+            b_entries += bytes.fromhex(h)
+        hash = write_object(parent, "tree", b_entries)
+        return "40000", p.name, hash
+
+    _, _, tree_hash = toEntry(root, tree)
     return tree_hash
 
 def setup_demo_repo(target_dir: Path):
@@ -234,42 +468,51 @@ def setup_demo_repo(target_dir: Path):
     # Initialize git repository
     init_repo(target_dir)
     
-    # Save current directory
-    original_dir = os.getcwd()
-    try:
-        # Change to target directory
-        os.chdir(target_dir)
-        
-        # Create tree and commit
-        tree_hash = write_tree(target_dir)
-        timestamp = int(time.time())
-        contents = b"".join([
-            b"tree %b\n" % tree_hash.encode(),
-            f"author Demo <demo@example.com> {timestamp} -0000\n".encode(),
-            f"committer Demo <demo@example.com> {timestamp} -0000\n\n".encode(),
-            b"Initial demo repository commit\n",
-            b"\n"
-        ])
-        commit_hash = write_object(target_dir, "commit", contents)
-        
-        # Update branch ref
-        refs_path = target_dir / ".git" / "refs" / "heads" / "main"
-        refs_path.parent.mkdir(parents=True, exist_ok=True)
-        refs_path.write_text(commit_hash + "\n")
-        
-        print(f"Created demo repository at {target_dir}")
-        print(f"Commit hash: {commit_hash}")
-        return True
-    finally:
-        # Restore original directory
-        os.chdir(original_dir)
+    # Create tree and commit
+    tree_hash = write_tree(target_dir)
+    timestamp = int(time.time())
+    contents = b"".join([
+        b"tree %b\n" % tree_hash.encode(),
+        f"author Demo <demo@example.com> {timestamp} -0000\n".encode(),
+        f"committer Demo <demo@example.com> {timestamp} -0000\n\n".encode(),
+        b"Initial demo repository commit\n",
+        b"\n"
+    ])
+    commit_hash = write_object(target_dir, "commit", contents)
+    
+    # Update branch ref
+    refs_path = target_dir / ".git" / "refs" / "heads" / "main"
+    refs_path.parent.mkdir(parents=True, exist_ok=True)
+    refs_path.write_text(commit_hash + "\n")
+    
+    print(f"Created demo repository at {target_dir}")
+    print(f"Commit hash: {commit_hash}")
+    return True
 
 def main():
+    # Reject a bad level once here rather than failing on every object written
+    if (level := os.environ.get("GITIMPL_COMPRESSION")) is not None:
+        use_compression_level(level, "GITIMPL_COMPRESSION")
+
     match sys.argv[1:]:
         case ["init"]:
             init_repo(Path("."))
             print("Initialized git directory")
 
+        case ["--check-accel"]:
+            # Report the libraries backing hashlib and zlib so users can confirm accelerated builds
+            print(f"hashlib algorithms: {', '.join(sorted(hashlib.algorithms_guaranteed))}")
+            try:
+                import ssl
+                print(f"OpenSSL: {ssl.OPENSSL_VERSION}")
+            except ImportError:
+                print("OpenSSL: not available (Python built without ssl)")
+            print(f"zlib: {zlib.ZLIB_VERSION} (runtime {zlib.ZLIB_RUNTIME_VERSION})")
+            if "zlib-ng" in zlib.ZLIB_VERSION or ".zlib-ng" in zlib.ZLIB_RUNTIME_VERSION:
+                print("zlib-ng detected")
+            else:
+                print("zlib-ng not detected; using stock zlib")
+
         case ["cat-file", "-p", blob_sha]:
             _, content = read_object(Path("."), blob_sha)
             sys.stdout.buffer.write(content)
@@ -278,6 +521,11 @@ def main():
             hash = write_object(Path("."), "blob", Path(path).read_bytes())
             print(hash)
 
+        case ["hash-object", "-c", level, "-w", path]:
+            use_compression_level(level)
+            hash = write_object(Path("."), "blob", Path(path).read_bytes())
+            print(hash)
+
         case ["ls-tree", "--name-only", tree_sha]:
             _, contents = read_object(Path("."), tree_sha)
             items = []
@@ -294,6 +542,11 @@ def main():
             tree_hash = write_tree()
             print(tree_hash)
 
+        case ["write-tree", "-c", level]:
+            use_compression_level(level)
+            tree_hash = write_tree()
+            print(tree_hash)
+
         case ["commit-tree", tree_sha, "-p", commit_sha, "-m", message]:
             contents = b"".join([
                 b"tree %b\n" % tree_sha.encode(),
@@ -306,9 +559,28 @@ def main():
             hash = write_object(Path("."), "commit", contents)
             print(hash)
 
-        case ["clone", url, dir]:
+        case ["clone", *flags, url, dir] if set(flags) <= {"--no-system-git"}:
             parent = Path(dir)
             
+            # Native git has SHA-NI/zlib-ng builds and parallel delta resolution, so prefer it when present
+            git = shutil.which("git")
+            if git and "--no-system-git" not in flags:
+                existed = parent.exists()
+                try:
+                    print(f"Cloning {url} with {git}...")
+                    # Never prompt for credentials; a private or missing repo should fail into the fallbacks
+                    subprocess.run(
+                        [git, "clone", "--depth", "1", url, dir],
+                        check=True,
+                        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+                    )
+                    return
+                except subprocess.CalledProcessError as e:
+                    print(f"System git clone failed: {e}")
+                    print("Falling back to the built-in clone...")
+                    if parent.exists() and not existed:
+                        shutil.rmtree(parent)
+            
             try:
                 # First try to clone using the original HTTP protocol method
                 print(f"Attempting to clone {url} using Git protocol...")
@@ -318,11 +590,9 @@ def main():
                     req = urllib.request.Request(f"{url}/info/refs?service=git-upload-pack")
                     with urllib.request.urlopen(req) as f:
                         refs = {
-                            bs[1].decode(): bs[0].decode()
-                            for bs0 in cast(bytes, f.read()).split(b"\n")
-                            if (bs1 := bs0[4:]) and not bs1.startswith(b"#")
-                            and (bs2 := bs1.split(b"\0")[0])
-                            and (bs := (bs2[4:] if bs2.endswith(b"HEAD") else bs2).split(b" "))
+                            m.group(2).decode(): m.group(1).decode()
+                            for m in REF_LINE_RE.finditer(cast(bytes, f.read()))
+                            if not m.group(2).endswith(b"^{}")
                         }
 
                     # Create necessary directories for refs
@@ -344,73 +614,141 @@ def main():
                     with urllib.request.urlopen(req) as f:
                         pack_bytes = cast(bytes, f.read())
 
+                    # Frame the pkt-lines as views over the response rather than reslicing it per line
+                    pack_mv = memoryview(pack_bytes)
                     pack_lines = []
-                    while pack_bytes:
-                        line_len = int(pack_bytes[:4], 16)
+                    line_pos = 0
+                    while line_pos < len(pack_mv):
+                        line_len = int(bytes(pack_mv[line_pos:line_pos + 4]), 16)
                         if line_len == 0:
                             break
-                        pack_lines.append(pack_bytes[4:line_len])
-                        pack_bytes = pack_bytes[line_len:]
+                        pack_lines.append(pack_mv[line_pos + 4:line_pos + line_len])
+                        line_pos += line_len
 
-                    pack_file = b"".join(l[1:] for l in pack_lines[1:])[8:]
-                    n_objs = struct.unpack("!I", pack_file[:4])[0]
-                    pack_file = pack_file[4:]
+                    pack_file = b"".join(l[1:] for l in pack_lines[1:])
+                    # Walk the pack through a view and an offset so advancing never copies the rest of it
+                    mv = memoryview(pack_file)
+                    n_objs = struct.unpack_from("!I", mv, 8)[0]
+                    pos = 12
 
-                    def next_size_type(bs: bytes) -> Tuple[str, int, bytes]:
-                        ty = (bs[0] & 0b01110000) >> 4
+                    def next_size_type(bs: memoryview, pos: int) -> Tuple[str, int, int]:
+                        ty = (bs[pos] & 0b01110000) >> 4
                         type_map = {1: "commit", 2: "tree", 3: "blob", 4: "tag", 6: "ofs_delta", 7: "ref_delta"}
-                        size = bs[0] & 0b00001111
-                        i, off = 1, 4
-                        while bs[i - 1] & 0b10000000:
-                            size += (bs[i] & 0b01111111) << off
-                            off += 7
-                            i += 1
-                        return type_map.get(ty, "unknown"), size, bs[i:]
+                        size = bs[pos] & 0b00001111
+                        if bs[pos] & 0b10000000:
+                            rest, n = decode_varint(bs, pos + 1)
+                            size |= rest << 4
+                            pos += n
+                        return type_map.get(ty, "unknown"), size, pos + 1
+
+                    def next_size(bs: bytes, pos: int) -> Tuple[int, int]:
+                        size, n = decode_varint(bs, pos)
+                        return size, pos + n
+
+                    def inflate(bs: memoryview, pos: int, size: int) -> Tuple[bytes, int]:
+                        # Hand zlib a window no bigger than the worst-case deflate output so that
+                        # unused_data only copies a bounded tail rather than the rest of the pack
+                        end = min(len(bs), pos + size + (size >> 12) + (size >> 14) + 64)
+                        dec = zlib.decompressobj()
+                        # The header gives the inflated size, so cap the output buffer at it
+                        content = dec.decompress(bs[pos:end], size)
+                        while not dec.eof:
+                            if dec.unconsumed_tail:
+                                # Consume the rest of the stream (the adler32 trailer)
+                                content += dec.decompress(dec.unconsumed_tail)
+                            elif end < len(bs):
+                                content += dec.decompress(bs[end:])
+                                end = len(bs)
+                            else:
+                                raise ValueError("Truncated object in pack file")
+                        return content, end - len(dec.unused_data)
 
-                    def next_size(bs: bytes) -> Tuple[int, bytes]:
-                        size, i, off = bs[0] & 0b01111111, 1, 7
-                        while bs[i - 1] & 0b10000000:
-                            size += (bs[i] & 0b01111111) << off
-                            off += 7
+                    def apply_delta(base: bytes, delta: bytes) -> bytearray:
+                        base_mv = memoryview(base)
+                        _, i = next_size(delta, 0)
+                        _, i = next_size(delta, i)
+                        target = bytearray()
+                        # Copies of adjacent base ranges are merged into one pending run and
+                        # extended in a single call when the run breaks
+                        run_start = run_end = 0
+                        while i < len(delta):
+                            op = delta[i]
                             i += 1
-                        return size, bs[i:]
-
-                    for _ in range(n_objs):
-                        ty, _, pack_file = next_size_type(pack_file)
-                        if ty in {"commit", "tree", "blob", "tag"}:
-                            dec = zlib.decompressobj()
-                            content = dec.decompress(pack_file)
-                            pack_file = dec.unused_data
-                            write_object(parent, ty, content)
-                        elif ty == "ref_delta":
-                            base_sha = pack_file[:20].hex()
-                            pack_file = pack_file[20:]
-                            dec = zlib.decompressobj()
-                            content = dec.decompress(pack_file)
-                            pack_file = dec.unused_data
-                            _, base_content = read_object(parent, base_sha)
-                            _, content = next_size(content)
-                            _, content = next_size(content)
-                            target_content = b""
-                            while content:
-                                is_copy = content[0] & 0b10000000
-                                if is_copy:
-                                    data_ptr, offset, size = 1, 0, 0
-                                    for i in range(4):
-                                        if content[0] & (1 << i):
-                                            offset |= content[data_ptr] << (i * 8)
-                                            data_ptr += 1
-                                    for i in range(3):
-                                        if content[0] & (1 << (4 + i)):
-                                            size |= content[data_ptr] << (i * 8)
-                                            data_ptr += 1
-                                    content = content[data_ptr:]
-                                    target_content += base_content[offset:offset + size]
+                            if op & 0b10000000:
+                                offset, size = 0, 0
+                                for k in range(4):
+                                    if op & (1 << k):
+                                        offset |= delta[i] << (k * 8)
+                                        i += 1
+                                for k in range(3):
+                                    if op & (1 << (4 + k)):
+                                        size |= delta[i] << (k * 8)
+                                        i += 1
+                                if size == 0:
+                                    size = 0x10000
+                                if offset != run_end:
+                                    target.extend(base_mv[run_start:run_end])
+                                    run_start = offset
+                                run_end = offset + size
+                            else:
+                                target.extend(base_mv[run_start:run_end])
+                                run_start = run_end
+                                target.extend(delta[i:i + op])
+                                i += op
+                        target.extend(base_mv[run_start:run_end])
+                        return target
+
+                    # Hashing, deflating and writing release the GIL, so each object is handed to a thread
+                    # pool as soon as it is inflated. Only a bounded number of writes are in flight, and a
+                    # delta is applied once its base has been written, reading the base back from disk,
+                    # so at most a handful of objects are held in memory at a time.
+                    max_in_flight = 2 * (os.cpu_count() or 1)
+                    in_flight = deque()
+                    written = set()
+                    waiting: Dict[str, List[bytes]] = {}
+
+                    def finish(future):
+                        sha = future.result()
+                        written.add(sha)
+                        for delta in waiting.pop(sha, []):
+                            resolve(sha, delta)
+
+                    def submit(ty: str, content: bytes):
+                        while len(in_flight) >= max_in_flight:
+                            finish(in_flight.popleft())
+                        in_flight.append(executor.submit(write_object, parent, ty, content))
+
+                    def resolve(base_sha: str, delta: bytes):
+                        # A delta always has the same type as its base
+                        base_ty, base_content = read_object(parent, base_sha)
+                        submit(base_ty, apply_delta(base_content, delta))
+
+                    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                        for _ in range(n_objs):
+                            ty, size, pos = next_size_type(mv, pos)
+                            if ty in {"commit", "tree", "blob", "tag"}:
+                                content, pos = inflate(mv, pos, size)
+                                submit(ty, content)
+                            elif ty == "ref_delta":
+                                base_sha = mv[pos:pos + 20].hex()
+                                pos += 20
+                                content, pos = inflate(mv, pos, size)
+                                # Bases normally come earlier in the pack, so wait for pending writes to land
+                                while base_sha not in written and in_flight:
+                                    finish(in_flight.popleft())
+                                if base_sha in written:
+                                    resolve(base_sha, content)
                                 else:
-                                    size = content[0]
-                                    target_content += content[1:size + 1]
-                                    content = content[size + 1:]
-                            write_object(parent, "blob", target_content)
+                                    waiting.setdefault(base_sha, []).append(content)
+
+                        while in_flight or waiting:
+                            if in_flight:
+                                finish(in_flight.popleft())
+                            else:
+                                # Anything left refers to a base outside the pack, which must already be stored
+                                base_sha, deltas = waiting.popitem()
+                                for delta in deltas:
+                                    resolve(base_sha, delta)
 
                     def render_tree(parent: Path, dir: Path, sha: str):
                         dir.mkdir(parents=True, exist_ok=True)